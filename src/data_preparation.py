@@ -5,8 +5,9 @@ NASA Turbofan Engine Degradation Dataset Simülasyonu ve Hazırlama
 
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Ekran yok; PNG üretimi için GUI'siz backend
 import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 
 def create_directories():
@@ -86,6 +87,9 @@ def analyze_data(df):
     print("\n4. Son 5 Kayıt (Degradasyon etkisi):")
     print(df.tail().to_string())
 
+# Grafikte motor başına çizilecek en fazla nokta (fazlası piksel sayısını aşar)
+MAX_PLOT_POINTS = 1000
+
 def visualize_data(df):
     """Veri setini görselleştir"""
     print("GÖRSELLEŞTİRME")
@@ -100,15 +104,21 @@ def visualize_data(df):
               'Basınç Sensörü (psi)', 'Titreşim Sensörü (g)', 
               'Devir Sayısı (RPM)', 'Sağlık Göstergesi (%)']
     
+    # Motorlara ayırma ve seyreltme bir kez yapılır; 6 grafik aynı parçaları kullanır
+    # Eşit aralıklı seyreltme: eğilim korunur, çizim maliyeti düşer
+    engines = []
+    for engine, engine_data in df.groupby('engine_id', sort=False):
+        step = max(1, -(-len(engine_data) // MAX_PLOT_POINTS))
+        engines.append((engine, engine_data.iloc[::step]))
+    
     for idx, (col, title) in enumerate(zip(sensor_cols, titles)):
         row = idx // 2
         col_idx = idx % 2
         ax = axes[row, col_idx]
         
-        for engine in df['engine_id'].unique():
-            engine_data = df[df['engine_id'] == engine]
+        for engine, engine_data in engines:
             ax.plot(engine_data['cycle'], engine_data[col], 
-                   label=f'Motor {engine}', alpha=0.7, linewidth=2)
+                   label=f'Motor {engine}', alpha=0.7, linewidth=2, rasterized=True)
         
         ax.set_xlabel('Çevrim (Zaman)', fontsize=10)
         ax.set_ylabel('Sensör Değeri', fontsize=10)
@@ -119,10 +129,12 @@ def visualize_data(df):
         if col == 'health_indicator':
             ax.axhline(y=30, color='red', linestyle='--', linewidth=2, alpha=0.7)
     
-    plt.tight_layout()
+    # Yerleşim bir kez hesaplanır (bbox_inches='tight' kayıtta ikinci geçiş yapar);
+    # 16x12 inç tuval için 120 dpi yeterli, 300 dpi'ye göre ~6x az piksel
+    fig.tight_layout()
 
     output_path = 'output/sensor_data_analysis.png'
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    fig.savefig(output_path, dpi=120)
     print(f"✓ Görselleştirme kaydedildi: {output_path}")
     
     plt.close()
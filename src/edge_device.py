@@ -224,7 +224,7 @@ class EdgeComputingDevice:
         return {
             'device_id': self.device_id,
             'node_id': sensor_reading['node_id'],
-            'timestamp': sensor_reading['timestamp'],
+            'ts_ms': sensor_reading['ts_ms'],
             'cycle': sensor_reading['cycle'],
             'has_anomaly': len(anomalies) > 0,
             'anomaly_count': len(anomalies),
@@ -276,7 +276,7 @@ def test_edge_device():
     # Test verisi (örnek sensör okuması)
     test_reading = {
         'node_id': 1,
-        'timestamp': datetime.now().isoformat(),
+        'ts_ms': time.time_ns() // 1_000_000,
         'cycle': 150,
         'measurements': {
             'temperature_1': 555.0,  # Eşiği aşıyor!
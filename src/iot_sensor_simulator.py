@@ -6,9 +6,13 @@ Bu modül bağımsız çalışmaz, 05_main_analysis.py tarafından kullanılır
 
 import json
 import time
-from datetime import datetime
+import numpy as np
 import pandas as pd
 
+# read_sensor_data'nın okuduğu sütunlar (önbellekteki sıra)
+SENSOR_COLUMNS = ['cycle', 'sensor_temp1', 'sensor_temp2', 'sensor_pressure',
+                  'sensor_vibration', 'sensor_rpm', 'health_indicator']
+
 class IoTSensorNode:
     """
     ESP32 tabanlı IoT sensör düğümü simülasyonu
@@ -23,6 +27,8 @@ class IoTSensorNode:
         """
         self.node_id = node_id
         self.data_source = data_source.reset_index(drop=True)
+        # Satır başına pandas .iloc yerine bitişik NumPy dizisinden okunur
+        self._cols = np.ascontiguousarray(self.data_source[SENSOR_COLUMNS].to_numpy(dtype=np.float64))
         self.current_cycle = 0
         self.total_cycles = len(data_source)
         
@@ -38,22 +44,22 @@ class IoTSensorNode:
         if self.current_cycle >= self.total_cycles:
             return None
         
-        row = self.data_source.iloc[self.current_cycle]
+        cycle, temp1, temp2, pressure, vibration, rpm, health = self._cols[self.current_cycle].tolist()
         self.current_cycle += 1
         
         # Gerçek sensör verisi formatı
         sensor_reading = {
             'node_id': self.node_id,
-            'timestamp': datetime.now().isoformat(),
-            'cycle': int(row['cycle']),
+            'ts_ms': time.time_ns() // 1_000_000,  # epoch ms
+            'cycle': int(cycle),
             'measurements': {
-                'temperature_1': float(row['sensor_temp1']),
-                'temperature_2': float(row['sensor_temp2']),
-                'pressure': float(row['sensor_pressure']),
-                'vibration': float(row['sensor_vibration']),
-                'rpm': float(row['sensor_rpm'])
+                'temperature_1': temp1,
+                'temperature_2': temp2,
+                'pressure': pressure,
+                'vibration': vibration,
+                'rpm': rpm
             },
-            'health': float(row['health_indicator']),
+            'health': health,
             'metadata': {
                 'sensor_type': 'ESP32_INDUSTRIAL',
                 'firmware_version': '1.2.3',
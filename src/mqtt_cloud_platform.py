@@ -4,11 +4,12 @@ MQTT ile Bulut Platform Entegrasyonu
 ThingsBoard benzeri bulut platformu simülasyonu
 """
 
-import json
 import time
 from datetime import datetime
 from collections import defaultdict
+import msgpack
 import paho.mqtt.client as mqtt
+from mqtt_network_loop import start_network, stop_network
 
 class CloudPlatform:
     """
@@ -16,53 +17,52 @@ class CloudPlatform:
     MQTT ile veri alır, dashboard verileri üretir
     """
     
-    def __init__(self, platform_id='cloud_platform_01', broker='broker.hivemq.com', port=1883):
+    def __init__(self, platform_id='cloud_platform_01', broker='broker.hivemq.com', port=1883, verbose=True):
         """
         Args:
             platform_id (str): Platform ID
             broker (str): MQTT broker
             port (int): MQTT port
+            verbose (bool): Her kritik uyarıyı anında yazdır (False: yalnızca say)
         """
         self.platform_id = platform_id
         self.broker = broker
         self.port = port
+        self.verbose = verbose
         
         # MQTT client
         self.client = mqtt.Client(client_id=platform_id)
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
         self.client.on_message = self.on_message
         
         # Subscribe topic'ler
         self.alert_topic = "iot/cloud/alerts"
         self.sensor_topic = "iot/sensors/+/data"  # Tüm sensörler
         
-        # Veri depolama
-        self.telemetry_data = defaultdict(list)  # node_id: [data_points]
-        self.alerts = []
         self.device_status = {}
         
-        # İstatistikler
-        self.statistics = {
-            'total_messages': 0,
-            'alert_messages': 0,
-            'summary_messages': 0,
-            'telemetry_messages': 0,
-            'critical_alerts': 0,
-            'warnings': 0,
-            'devices_online': 0
-        }
+        # Veri depolama ve istatistikler
+        self.reset_stats()
         
         # Bağlantı durumu
         self.connected = False
+        self._network_loop = None
         
         print(f"[{self.platform_id}] Cloud Platform başlatıldı")
     
-    def connect(self):
-        """MQTT broker'a bağlan"""
+    def connect(self, network_loop=None):
+        """
+        MQTT broker'a bağlan
+        
+        Args:
+            network_loop (MQTTNetworkLoop): Paylaşılan ağ döngüsü (None ise loop_start)
+        """
         try:
             print(f"[{self.platform_id}] MQTT broker'a bağlanılıyor: {self.broker}:{self.port}")
             self.client.connect(self.broker, self.port, 60)
-            self.client.loop_start()
+            self._network_loop = network_loop
+            start_network(self.client, network_loop)
             
             # Bağlantı için bekle
             timeout = 10
@@ -81,6 +81,25 @@ class CloudPlatform:
             print(f"✗ Bağlantı hatası: {e}")
             return False
     
+    def reset_stats(self):
+        """
+        Toplanan veriyi ve sayaçları sıfırla. Bağlantı ve abonelikler
+        korunur; aynı istemci birden fazla senaryoda kullanılabilir.
+        """
+        self.telemetry_data = defaultdict(list)  # node_id: [data_points]
+        self.alerts = []
+        
+        self.statistics = {
+            'total_messages': 0,
+            'bytes_received': 0,
+            'alert_messages': 0,
+            'summary_messages': 0,
+            'telemetry_messages': 0,
+            'critical_alerts': 0,
+            'warnings': 0,
+            'devices_online': 0
+        }
+    
     def on_connect(self, client, userdata, flags, rc):
         """Bağlantı callback'i"""
         if rc == 0:
@@ -97,19 +116,31 @@ class CloudPlatform:
         else:
             print(f"[{self.platform_id}] Bağlantı hatası: {rc}")
     
+    def on_disconnect(self, client, userdata, rc):
+        """Bağlantı kopma callback'i (rc != 0: beklenmeyen kopma)"""
+        self.connected = False
+        if rc != 0:
+            print(f"[{self.platform_id}] MQTT bağlantısı koptu: {rc}")
+    
     def on_message(self, client, userdata, msg):
         """Mesaj alma callback'i"""
         try:
-            payload = json.loads(msg.payload.decode())
+            payload = msgpack.unpackb(msg.payload, raw=False)
             topic = msg.topic
             
             self.statistics['total_messages'] += 1
+            self.statistics['bytes_received'] += len(msg.payload)
             
             # Mesaj tipine göre işle
             if 'cloud/alerts' in topic:
                 self.process_alert(payload)
             elif 'sensors' in topic:
-                self.process_telemetry(payload)
+                # Toplu yayın: node_id'ye göre ayrı telemetri kayıtları
+                if isinstance(payload, list):
+                    for reading in payload:
+                        self.process_telemetry(reading)
+                else:
+                    self.process_telemetry(payload)
             
         except Exception as e:
             print(f"Mesaj işleme hatası: {e}")
@@ -145,8 +176,9 @@ class CloudPlatform:
                 'critical': message.get('critical', False)
             })
             
-            # Dashboard için kritik uyarı göster
-            if message.get('critical'):
+            # Dashboard için kritik uyarı göster (yoğun yükte her mesajda
+            # stdout'a yazmamak için verbose=False; özet dashboard'da)
+            if self.verbose and message.get('critical'):
                 print(f"\n⚠️  CRITICAL ALERT - Node {message.get('node_id')}")
                 for anomaly in anomalies[:2]:  # İlk 2 anomali
                     print(f"   └─ {anomaly.get('sensor')}: {anomaly.get('value')}")
@@ -154,10 +186,11 @@ class CloudPlatform:
         elif alert_type == 'SUMMARY':
             self.statistics['summary_messages'] += 1
             
-            # Özet verisini kaydet
+            # Özet verisini kaydet (telemetri kayıtlarıyla aynı 'ts_ms' anahtarı;
+            # edge özetinde zaman damgası yoksa bulutun alış zamanı kullanılır)
             node_id = message.get('node_id')
             self.telemetry_data[node_id].append({
-                'timestamp': message.get('timestamp'),
+                'ts_ms': message.get('ts_ms', time.time_ns() // 1_000_000),
                 'health': message.get('health'),
                 'measurements': message.get('measurements')
             })
@@ -183,7 +216,7 @@ class CloudPlatform:
         
         # Telemetri kaydet
         self.telemetry_data[node_id].append({
-            'timestamp': message.get('timestamp'),
+            'ts_ms': message.get('ts_ms'),
             'cycle': message.get('cycle'),
             'measurements': message.get('measurements'),
             'health': message.get('health')
@@ -232,6 +265,7 @@ class CloudPlatform:
         print("\n1. GENEL İSTATİSTİKLER:")
         print(f"   Aktif Cihaz: {dashboard['active_devices']}")
         print(f"   Toplam Mesaj: {dashboard['statistics']['total_messages']}")
+        print(f"   Alınan Veri: {dashboard['statistics']['bytes_received'] / 1024:.1f} KB")
         print(f"   Uyarı Mesajı: {dashboard['statistics']['alert_messages']}")
         print(f"   Kritik Uyarı: {dashboard['statistics']['critical_alerts']}")
         print(f"   Uyarı: {dashboard['statistics']['warnings']}")
@@ -255,8 +289,7 @@ class CloudPlatform:
     
     def disconnect(self):
         """Bağlantıyı kapat"""
-        self.client.loop_stop()
-        self.client.disconnect()
+        stop_network(self.client, self._network_loop)
         print(f"[{self.platform_id}] MQTT bağlantısı kapatıldı")
     
     def get_statistics(self):
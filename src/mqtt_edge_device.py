@@ -4,15 +4,17 @@ Yapay Zeka Destekli Kenar Bilişim Cihazı
 Yerel İşleme ve Otonom Karar Mekanizması
 """
 
-import json
 import time
-import statistics
-import pickle
+import joblib
 import numpy as np
 import os
+import msgpack
+import queue
+import threading
 from collections import deque
 from datetime import datetime
 import paho.mqtt.client as mqtt
+from mqtt_network_loop import start_network, stop_network
 
 class MQTTEdgeDevice:
     def __init__(self, device_id='edge_pi_01', broker='broker.hivemq.com', port=1883):
@@ -22,6 +24,7 @@ class MQTTEdgeDevice:
         
         self.client = mqtt.Client(client_id=device_id)
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
         self.client.on_message = self.on_message
         
         # 1. Konu Başlıkları
@@ -38,14 +41,26 @@ class MQTTEdgeDevice:
         self.thresholds = {'temperature_1': 560.0, 'vibration': 0.12}
         
         # 4. Performans Metrikleri (Analiz dosyasıyla uyumlu isimler)
+        self.reset_stats()
+        self.connected = False
+        self._network_loop = None
+        # Paylaşılan ağ döngüsünde AI çıkarımı ayrı işçide yapılır (döngü bloklanmaz)
+        self._inbox = None
+        self._worker = None
+
+    def reset_stats(self):
+        """Metrikleri sıfırla (bağlantı korunur; senaryolar arasında kullanılır)"""
         self.metrics = {
             'total_received': 0,
+            'bytes_received': 0,
             'ai_anomalies': 0,
             'cloud_messages_sent': 0,  
+            'bytes_sent_to_cloud': 0,
             'local_decisions': 0,     
-            'processing_times': []
+            # Süreler listede tutulmaz; ortalama için toplam + adet yeterli
+            'processing_time_total': 0.0,
+            'processing_count': 0
         }
-        self.connected = False
 
     def load_ai_brain(self):
         """Eğitilmiş makine öğrenmesi modelini yükler"""
@@ -55,8 +70,12 @@ class MQTTEdgeDevice:
                 model_path = '../models/anomaly_detector.pkl'
             
             if os.path.exists(model_path):
-                with open(model_path, 'rb') as f:
-                    self.model = pickle.load(f)
+                # joblib.load hem sıkıştırılmış hem düz pickle dosyalarını okur
+                self.model = joblib.load(model_path)
+                # Kenarda tek satırlık tahmin yapılır; paralel iş havuzu
+                # (eğitimdeki n_jobs=-1) burada yalnızca ek yük getirir
+                if hasattr(self.model, 'n_jobs'):
+                    self.model.n_jobs = 1
                 self.ai_enabled = True
                 print(f"[{self.device_id}]  AI Modeli Yüklendi ve Aktif!")
             else:
@@ -64,10 +83,16 @@ class MQTTEdgeDevice:
         except Exception as e:
             print(f"Model yükleme hatası: {e}")
 
-    def connect(self):
+    def connect(self, network_loop=None):
         try:
             self.client.connect(self.broker, self.port, 60)
-            self.client.loop_start()
+            self._network_loop = network_loop
+            if network_loop is not None:
+                self._inbox = queue.SimpleQueue()
+                self._worker = threading.Thread(target=self._process_inbox,
+                                                name=f'{self.device_id}-ai', daemon=True)
+                self._worker.start()
+            start_network(self.client, network_loop)
             time.sleep(1)
             return True
         except:
@@ -78,12 +103,39 @@ class MQTTEdgeDevice:
             self.connected = True
             self.client.subscribe(self.sensor_topic)
 
+    def on_disconnect(self, client, userdata, rc):
+        self.connected = False
+
     def on_message(self, client, userdata, msg):
+        self.metrics['bytes_received'] += len(msg.payload)
         try:
-            payload = json.loads(msg.payload.decode())
-            self.process_data_at_edge(payload)
-        except:
-            pass
+            payload = msgpack.unpackb(msg.payload, raw=False)
+        except ValueError:
+            # Ortak broker: konuya başka formatta yayın yapanlar olabilir
+            return
+        
+        # Toplu yayın: bir mesajda birden fazla sensör okuması
+        readings = payload if isinstance(payload, list) else [payload]
+        if self._inbox is not None:
+            # Ağ döngüsü iş parçacığı: tahmin (~ms/okuma) işçiye bırakılır
+            self._inbox.put(readings)
+        else:
+            self._process_readings(readings)
+
+    def _process_inbox(self):
+        """İşçi iş parçacığı: kuyruktaki okumaları sırayla işler (None = dur)"""
+        while True:
+            readings = self._inbox.get()
+            if readings is None: return
+            self._process_readings(readings)
+
+    def _process_readings(self, readings):
+        for reading in readings:
+            if not isinstance(reading, dict): continue
+            try:
+                self.process_data_at_edge(reading)
+            except Exception as e:
+                print(f"Mesaj işleme hatası: {e}")
 
     def process_data_at_edge(self, data):
         """
@@ -107,19 +159,17 @@ class MQTTEdgeDevice:
                     measurements.get('rpm', 0)
                 ]).reshape(1, -1)
                 
-                prediction = self.model.predict(features)[0]
+                # Tek geçiş: predict() zaten predict_proba'nın argmax'ı, ağaçları
+                # iki kez gezmeye gerek yok. Güven > 0.7 ise tahmin de Arıza'dır.
+                confidence = self.model.predict_proba(features)[0][1]
                 
-                if prediction == 1: # Arıza
-                    probs = self.model.predict_proba(features)
-                    confidence = probs[0][1]
-                    
-                    if confidence > 0.7:
-                        self.metrics['ai_anomalies'] += 1
-                        anomalies.append({
-                            'type': 'AI_DETECTED_ANOMALY',
-                            'confidence': f"%{confidence*100:.1f}",
-                            'severity': 'CRITICAL'
-                        })
+                if confidence > 0.7: # Arıza
+                    self.metrics['ai_anomalies'] += 1
+                    anomalies.append({
+                        'type': 'AI_DETECTED_ANOMALY',
+                        'confidence': f"%{confidence*100:.1f}",
+                        'severity': 'CRITICAL'
+                    })
 
                          #print(f"    [AI] Node {node_id} Anomali! (%{confidence*100:.0f})")
             except Exception as e:
@@ -131,7 +181,8 @@ class MQTTEdgeDevice:
 
         # İşlem süresini kaydet
         proc_time = (time.time() - start_time) * 1000
-        self.metrics['processing_times'].append(proc_time)
+        self.metrics['processing_time_total'] += proc_time
+        self.metrics['processing_count'] += 1
 
         # --- C. KARAR VE EYLEM ---
         if anomalies:
@@ -142,6 +193,60 @@ class MQTTEdgeDevice:
         elif self.metrics['total_received'] % 20 == 0:
             self.send_summary_to_cloud(data)
 
+    def process_batch(self, node_ids, features, health):
+        """
+        process_data_at_edge'in vektörel karşılığı (çevrimdışı analiz):
+        tüm okumalar tek predict_proba çağrısıyla sınıflandırılır, karar ve
+        uyarı sayıları maskelerden çıkarılır; buluta gidecek mesajlar yalnızca
+        işaretli satırlar için kurulur ve yayınlanmadan sayılır.
+        features: (n, 5) temperature_1, temperature_2, pressure, vibration, rpm
+        """
+        n = len(features)
+        if n == 0: return
+        start_time = time.time()
+        
+        # --- A. YAPAY ZEKA ANALİZİ (tek çağrı) ---
+        confidence = np.zeros(n)
+        if self.ai_enabled:
+            try:
+                confidence = self.model.predict_proba(features)[:, 1]
+            except Exception as e:
+                print(f"AI Hatası: {e}")
+        ai_mask = confidence > 0.7
+        
+        # --- B. KURAL TABANLI ANALİZ ---
+        rule_mask = features[:, 0] > self.thresholds['temperature_1']
+        
+        anomaly_mask = ai_mask | rule_mask
+        # Heartbeat: anomali olmayan ve sıra numarası 20'nin katı olan okumalar
+        received = self.metrics['total_received'] + np.arange(1, n + 1)
+        summary_mask = ~anomaly_mask & (received % 20 == 0)
+        
+        self.metrics['total_received'] += n
+        self.metrics['ai_anomalies'] += int(ai_mask.sum())
+        self.metrics['processing_time_total'] += (time.time() - start_time) * 1000
+        self.metrics['processing_count'] += n
+        
+        # --- C. KARAR VE EYLEM (yalnızca işaretli satırlar) ---
+        # Çevrimdışı: istemci bağlı değil, mesajlar yayınlanmaz; kararlar maskeden
+        # sayılır, buluta gidecek mesajlar paketlenip yalnızca boyutları ölçülür
+        self.metrics['local_decisions'] += int(anomaly_mask.sum())
+        for i in np.flatnonzero(anomaly_mask):
+            anomalies = []
+            if ai_mask[i]:
+                anomalies.append({
+                    'type': 'AI_DETECTED_ANOMALY',
+                    'confidence': f"%{confidence[i]*100:.1f}",
+                    'severity': 'CRITICAL'
+                })
+            if rule_mask[i]:
+                anomalies.append({'type': 'HIGH_TEMP', 'severity': 'WARNING'})
+            self._count_cloud_message(self._alert_message({'node_id': int(node_ids[i])}, anomalies))
+        
+        for i in np.flatnonzero(summary_mask):
+            self._count_cloud_message(
+                self._summary_message({'node_id': int(node_ids[i]), 'health': float(health[i])}))
+
     def trigger_actuator(self, node_id, anomalies):
         """Yerel aktüatörleri tetikler"""
         action = "EMERGENCY_STOP" if any(a['severity'] == 'CRITICAL' for a in anomalies) else "ACTIVATE_FAN"
@@ -152,38 +257,54 @@ class MQTTEdgeDevice:
             'timestamp': datetime.now().isoformat(),
             'source': 'EDGE_COMPUTING_UNIT'
         }
-        self.client.publish(f"iot/actuators/{node_id}/command", json.dumps(msg))
+        self.client.publish(f"iot/actuators/{node_id}/command", msgpack.packb(msg, use_bin_type=True))
         self.metrics['local_decisions'] += 1 
 
     def send_alert_to_cloud(self, raw_data, anomalies):
         """Sadece önemli veriyi gönder"""
-        msg = {
+        self._publish_to_cloud(self._alert_message(raw_data, anomalies))
+
+    def send_summary_to_cloud(self, raw_data):
+        """Periyodik özet"""
+        self._publish_to_cloud(self._summary_message(raw_data))
+
+    def _alert_message(self, raw_data, anomalies):
+        return {
             'type': 'ANOMALY_REPORT',
             'node_id': raw_data.get('node_id'),
             'anomalies': anomalies,
             'timestamp': datetime.now().isoformat()
         }
-        self.client.publish(self.cloud_topic, json.dumps(msg))
-        self.metrics['cloud_messages_sent'] += 1 
 
-    def send_summary_to_cloud(self, raw_data):
-        """Periyodik özet"""
-        msg = {
+    def _summary_message(self, raw_data):
+        return {
             'type': 'STATUS_SUMMARY',
             'node_id': raw_data.get('node_id'),
             'avg_health': raw_data.get('health')
         }
-        self.client.publish(self.cloud_topic, json.dumps(msg))
-        self.metrics['cloud_messages_sent'] += 1 
+
+    def _count_cloud_message(self, msg):
+        """Mesajı paketler ve buluta giden trafik sayaçlarına ekler; paketi döner"""
+        payload = msgpack.packb(msg, use_bin_type=True)
+        self.metrics['cloud_messages_sent'] += 1
+        self.metrics['bytes_sent_to_cloud'] += len(payload)
+        return payload
+
+    def _publish_to_cloud(self, msg):
+        self.client.publish(self.cloud_topic, self._count_cloud_message(msg))
 
     def get_statistics(self):
         stats = self.metrics.copy()
-        if stats['processing_times']:
-            stats['avg_proc_time'] = statistics.mean(stats['processing_times'])
+        if stats['processing_count']:
+            stats['avg_proc_time'] = stats['processing_time_total'] / stats['processing_count']
         else:
             stats['avg_proc_time'] = 0
         return stats
 
     def disconnect(self):
-        self.client.loop_stop()
-        self.client.disconnect()
+        # Önce işçi durur: kuyruktaki okumaların yayınları bağlantı kapanmadan biter
+        if self._worker is not None:
+            self._inbox.put(None)
+            self._worker.join()
+            self._inbox = self._worker = None
+        stop_network(self.client, self._network_loop)
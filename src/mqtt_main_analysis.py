@@ -5,119 +5,322 @@ YOĞUN YÜK ALTINDA KENAR BİLİŞİM SİMÜLASYONU
 """
 
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Ekran yok; PNG üretimi için GUI'siz backend
 import matplotlib.pyplot as plt
 from mqtt_sensor_simulator import create_mqtt_sensors
 from mqtt_edge_device import MQTTEdgeDevice
 from mqtt_cloud_platform import CloudPlatform
+from mqtt_network_loop import MQTTNetworkLoop
+
+class LatencyAccumulator:
+    """
+    Gecikme istatistiklerini tek geçişte (online) biriktirir.
+    Örnekleri listede tutmaz; ortalama/min/maks her an hazırdır.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self._min = float('inf')
+        self._max = float('-inf')
+    
+    def extend(self, values):
+        """Bir dizi gecikmeyi tek seferde (vektörel) ekler"""
+        values = np.asarray(values)
+        if values.size == 0: return
+        self.count += values.size
+        # float32 örnekler float64'te toplanır (uzun koşularda hassasiyet)
+        self.total += float(values.sum(dtype=np.float64))
+        self._min = min(self._min, float(values.min()))
+        self._max = max(self._max, float(values.max()))
+    
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+    
+    def min(self):
+        return self._min if self.count else 0.0
+    
+    def max(self):
+        return self._max if self.count else 0.0
+
+def _save_figure(fig, path):
+    """Figürü PNG olarak yazar (arka plan iş parçacığında çalışır)"""
+    try:
+        fig.savefig(path)
+    finally:
+        plt.close(fig)
+    print(f"\n[INFO] Grafik kaydedildi: {path}")
 
 class MQTTSystemSimulation:
-    def __init__(self, num_cycles=5000, num_sensors=4):
+    def __init__(self, num_cycles=5000, num_sensors=4, offline=False):
         self.num_cycles = num_cycles
         self.num_sensors = num_sensors
         self.broker = 'broker.hivemq.com'
         self.port = 1883
         
+        # offline=True: broker yok (test / çevrimdışı analiz), bekleme yok
+        self.offline = offline
+        self._rng = np.random.default_rng()
+        
+        # Canlı modda istemciler senaryolar arasında yeniden kullanılır:
+        # bağlantı ilk senaryoda bir kez kurulur, close() ile kapanır
+        self.sensors = self.edge = self.cloud = None
+        self._network_loop = None
+        self._connected = False
+        # Broker'ın onayladığı (istemci, mid) abonelik istekleri; SUBACK/UNSUBACK beklenir
+        self._acked = set()
+        # Senaryonun istediği abonelik: istemci -> (konu, abone_olsun); yeniden bağlanınca uygulanır
+        self._subscriptions = {}
+        self._ack_cond = threading.Condition()
+        if not offline:
+            # Sensör grubu, edge ve cloud istemcileri tek select() iş parçacığında
+            self._network_loop = MQTTNetworkLoop()
+            self.sensors = create_mqtt_sensors(self.num_sensors, self.broker, self.port)
+            self.edge = MQTTEdgeDevice(device_id='edge_sim', broker=self.broker)
+            self.cloud = CloudPlatform(platform_id='cloud_main', broker=self.broker, verbose=False)
+        
+        # PNG kodlaması ana akışı bekletmesin diye tek işçili havuz
+        self._save_pool = ThreadPoolExecutor(max_workers=1)
+        # Bekleyen kayıtlar; close() sonuçlarını alır, kayıt hatası sessizce kaybolmaz
+        self._pending_saves = []
+        
         # Sonuçları sakla
         self.results = {
-            'edge': {'latency': [], 'bandwidth': 0, 'decisions': 0},
-            'cloud': {'latency': [], 'bandwidth': 0, 'decisions': 0}
+            'edge': {'latency': LatencyAccumulator(), 'bandwidth': 0, 'bandwidth_bytes': 0, 'decisions': 0},
+            'cloud': {'latency': LatencyAccumulator(), 'bandwidth': 0, 'bandwidth_bytes': 0, 'decisions': 0}
         }
 
+    # Gecikme modeli (ms): (ağ aralığı, işleme aralığı)
+    LATENCY_MODEL = {
+        'edge': ((2, 10), (3, 15)),     # Sensör -> Edge (LAN) + AI İşleme
+        'cloud': ((60, 200), (20, 50))  # Sensör -> Cloud (WAN) + Cloud İşleme
+    }
+
     def run_scenario(self, mode='edge'):
         """
         Tek bir fonksiyonla iki senaryoyu da çalıştırır.
         mode: 'edge' veya 'cloud'
         """
         scenario_name = "KENAR BİLİŞİM (EDGE AI)" if mode == 'edge' else "GELENEKSEL BULUT"
+        self._run((mode,), scenario_name)
+
+    def run_both(self):
+        """
+        İki senaryoyu tek geçişte çalıştırır: aynı sensör akışını kenar cihaz
+        işler, bulut ise hem ham veriyi hem kenar uyarılarını dinler.
+        Tek veri üretimi, tek bağlantı kurulumu, senaryolar arası bekleme yok.
+        """
+        self._run(('edge', 'cloud'), "KENAR + BULUT (TEK GEÇİŞ)")
+
+    def _run(self, modes, scenario_name):
         print("\n" + "="*70)
         print(f"SENARYO BAŞLATILIYOR: {scenario_name}")
         print(f"Hedef: {self.num_cycles} Veri Paketi | Sensör Sayısı: {self.num_sensors}")
         print("="*70)
         
-        # 1. Bileşenleri Başlat
-        # Not: create_mqtt_sensors artık veri seti istemiyor, canlı üretiyor.
-        sensors = create_mqtt_sensors(self.num_sensors, self.broker, self.port)
+        if self.offline:
+            self._run_offline(modes)
+            return
         
-        if mode == 'edge':
-            edge = MQTTEdgeDevice(device_id='edge_sim', broker=self.broker)
-            edge.connect()
-            # Cloud sadece uyarıları dinler
-            cloud = CloudPlatform(platform_id='cloud_listener', broker=self.broker)
-            cloud.connect()
-        else:
-            # Cloud her şeyi dinler
-            cloud = CloudPlatform(platform_id='cloud_main', broker=self.broker)
-            cloud.connect()
-            cloud.client.subscribe("iot/sensors/+/data")
+        # 1. Bileşenleri Hazırla (bağlantı yalnızca ilk senaryoda kurulur)
+        self._connect()
+        sensors, edge, cloud = self.sensors, self.edge, self.cloud
+        sensors.reset_stats()
+        edge.reset_stats()
+        cloud.reset_stats()
         
-        for s in sensors: s.connect()
-        time.sleep(2) # Bağlantıların oturması için
+        # Edge yalnızca kendi senaryosunda sensörleri dinler; Cloud kendi
+        # senaryosunda her şeyi, aksi halde sadece uyarıları. Yayın başlamadan
+        # broker onayı beklenir (farklı bağlantılar arasında sıra garantisi yok)
+        self._set_subscriptions([
+            (edge.client, edge.sensor_topic, 'edge' in modes),
+            (cloud.client, cloud.sensor_topic, 'cloud' in modes),
+        ])
         
         print("\n Yoğun veri akışı başladı...")
         start_time = time.time()
         
         processed_count = 0
+        label = '+'.join(m.upper() for m in modes)
+        
+        # B. Gecikme Simülasyonu: tüm paketlerin gecikmeleri döngüden önce tek seferde
+        # (aynı paket her senaryo için ölçülür)
+        latencies = {mode: self._draw_latencies(mode, self.num_cycles) for mode in modes}
         
         # --- SİMÜLASYON DÖNGÜSÜ ---
         while processed_count < self.num_cycles:
-            for sensor in sensors:
-                if processed_count >= self.num_cycles: break
-                
-                # A. Veri Üretimi ve Gönderimi
-                if sensor.read_and_publish():
-                    processed_count += 1
-                    
-                    # B. Gecikme Simülasyonu
-                    if mode == 'edge':
-                        # Sensör -> Edge (LAN: Hızlı, 2-10ms) + AI İşleme (3-15ms)
-                        lat = np.random.uniform(2, 10) + np.random.uniform(3, 15)
-                    else:
-                        # Sensör -> Cloud (WAN: Yavaş, 60-200ms) + Cloud İşleme (20-50ms)
-                        lat = np.random.uniform(60, 200) + np.random.uniform(20, 50)
-                    
-                    self.results[mode]['latency'].append(lat)
-                    
-                    # İlerleme Çubuğu (Her 500 veride bir)
-                    if processed_count % 500 == 0:
-                        print(f"   [{mode.upper()}] İlerleme: {processed_count}/{self.num_cycles} veri işlendi...")
+            # A. Veri Üretimi ve Gönderimi (tüm sensörler tek mesajda)
+            sent = sensors.publish_all(self.num_cycles - processed_count)
+            processed_count += sent
+            
+            # İlerleme Çubuğu (Her 500 veride bir)
+            if sent and processed_count // 500 > (processed_count - sent) // 500:
+                print(f"   [{label}] İlerleme: {processed_count}/{self.num_cycles} veri işlendi...")
             
-            # Çok hızlı döngü (Yoğun trafik simülasyonu için sleep çok az)
-            time.sleep(0.01) 
+            # Gecikme zaten sentetik; yalnızca bağlantı yokken kısa bekle
+            if not sent:
+                time.sleep(0.01)
+        
+        # İstemciler senaryo sonunda kapanmadığı için broker ve edge kuyrukları
+        # burada boşaltılır; kalan mesajlar sonraki senaryoya (yeni abonelere) sızmaz
+        self._wait_for_delivery(modes, processed_count)
             
         total_time = time.time() - start_time
         print(f"\n✅ Senaryo Tamamlandı. Süre: {total_time:.2f} sn")
         
         # C. İstatistikleri Topla
+        for mode in modes:
+            self.results[mode]['latency'].extend(latencies[mode][:processed_count])
+            self._store_stats(mode, edge, processed_count, sensors.bytes_sent)
+
+    def _wait_for_delivery(self, modes, expected, timeout=60):
+        """Senaryoyu dinleyen edge/cloud gönderilen okumaların hepsini alana kadar (en fazla timeout sn) bekle"""
+        counters = {}
+        if 'edge' in modes:
+            counters['Edge'] = lambda: self.edge.metrics['total_received']
+        if 'cloud' in modes:
+            counters['Cloud'] = lambda: self.cloud.statistics['telemetry_messages']
+        start = time.time()
+        while any(count() < expected for count in counters.values()):
+            if (time.time() - start) >= timeout:
+                for name, count in counters.items():
+                    if count() < expected:
+                        print(f"[UYARI] {name} teslimat zaman aşımı: {count()}/{expected} okuma alındı")
+                return
+            time.sleep(0.1)
+
+    def _set_subscriptions(self, requests, timeout=5):
+        """
+        (istemci, konu, abone_olsun) isteklerini gönderir ve hepsinin
+        SUBACK/UNSUBACK'i gelene kadar (en fazla timeout sn) bekler.
+        """
+        with self._ack_cond:
+            pending = set()
+            for client, topic, wanted in requests:
+                self._subscriptions[client] = (topic, wanted)
+                rc, mid = client.subscribe(topic) if wanted else client.unsubscribe(topic)
+                if rc == 0: pending.add((client, mid))
+            if not self._ack_cond.wait_for(lambda: pending <= self._acked, timeout):
+                print("[UYARI] Abonelik onayı zaman aşımına uğradı")
+            self._acked -= pending
+
+    def _on_ack(self, client, userdata, mid, *args):
+        """on_subscribe / on_unsubscribe: onaylanan isteği kaydet"""
+        with self._ack_cond:
+            self._acked.add((client, mid))
+            self._ack_cond.notify_all()
+
+    def _restore_subscriptions(self, on_connect):
+        """
+        İstemcinin on_connect'ini sarar. Ağ döngüsü yeniden bağladığında
+        (temiz oturum) senaryo aboneliği broker'da yoktur; yeniden uygulanır.
+        """
+        def handler(client, userdata, flags, rc):
+            on_connect(client, userdata, flags, rc)
+            if rc == 0 and client in self._subscriptions:
+                topic, wanted = self._subscriptions[client]
+                if wanted:
+                    client.subscribe(topic)
+                else:
+                    client.unsubscribe(topic)
+        return handler
+
+    def _connect(self):
+        """Edge, cloud ve sensör grubunu bir kez bağla"""
+        if self._connected: return
+        for client in (self.edge.client, self.cloud.client):
+            client.on_subscribe = client.on_unsubscribe = self._on_ack
+            client.on_connect = self._restore_subscriptions(client.on_connect)
+        self.edge.connect(network_loop=self._network_loop)
+        self.cloud.connect(network_loop=self._network_loop)
+        self.sensors.connect(network_loop=self._network_loop) # Tek paylaşılan istemci
+        time.sleep(2) # Bağlantıların oturması için
+        self._connected = True
+
+    def close(self):
+        """Bağlantıları kapat ve bekleyen grafik kayıtlarını bitir (en sonda bir kez)"""
+        if self._connected:
+            self.edge.disconnect()
+            self.cloud.disconnect()
+            self.sensors.disconnect()
+            self._connected = False
+        if self._network_loop is not None:
+            self._network_loop.stop()
+        self._save_pool.shutdown(wait=True)
+        pending, self._pending_saves = self._pending_saves, []
+        for future in pending:
+            future.result() # Arka plandaki savefig hatası burada yeniden fırlatılır
+
+    def _run_offline(self, modes):
+        """
+        Broker'sız mod. Döngü başına Python işi yok: gecikmeler, sensör
+        okumaları ve edge kararları tek seferde vektörel üretilir;
+        sleep ve MQTT yayını atlanır.
+        """
+        start_time = time.time()
+        n = self.num_cycles
+        
+        for mode in modes:
+            self.results[mode]['latency'].extend(self._draw_latencies(mode, n))
+        
+        # Bant genişliği/karar sayısı için veri broker yerine doğrudan işlenir
+        sensors = create_mqtt_sensors(self.num_sensors, self.broker, self.port)
+        node_ids, features, health, packet_sizes = sensors.generate_batch(n)
+        
+        edge = None
+        if 'edge' in modes:
+            edge = MQTTEdgeDevice(device_id='edge_sim', broker=self.broker)
+            edge.process_batch(node_ids, features, health) # Tek predict_proba çağrısı
+        cloud_bytes = int(packet_sizes.sum()) if 'cloud' in modes else 0
+        
+        for mode in modes:
+            self._store_stats(mode, edge, n, cloud_bytes)
+        print(f"\n✅ Senaryo Tamamlandı (çevrimdışı). Süre: {time.time() - start_time:.2f} sn")
+
+    def _draw_latencies(self, mode, n):
+        """n paket için gecikmeleri (ms, float32) tek vektörel çağrıyla üretir"""
+        (net_lo, net_hi), (proc_lo, proc_hi) = self.LATENCY_MODEL[mode]
+        # Generator.uniform dtype almaz; float32 [0, 1) çekimi yerinde ölçeklenir
+        draws = self._rng.random((2, n), dtype=np.float32)
+        draws[0] *= net_hi - net_lo
+        draws[1] *= proc_hi - proc_lo
+        latencies = draws[0] + draws[1]
+        latencies += net_lo + proc_lo
+        return latencies
+
+    def _store_stats(self, mode, edge, processed_count, cloud_bytes):
         if mode == 'edge':
             stats = edge.get_statistics()
             self.results['edge']['bandwidth'] = stats['cloud_messages_sent']
+            self.results['edge']['bandwidth_bytes'] = stats['bytes_sent_to_cloud']
             self.results['edge']['decisions'] = stats['local_decisions']
             self.results['edge']['ai_anomalies'] = stats.get('ai_anomalies', 0)
-            edge.disconnect()
         else:
             # Cloud senaryosunda tüm veriler cloud'a gider
             self.results['cloud']['bandwidth'] = processed_count
+            self.results['cloud']['bandwidth_bytes'] = cloud_bytes
             self.results['cloud']['decisions'] = 0 # Cloud'da yerel karar yok
-        
-        cloud.disconnect()
-        for s in sensors: s.disconnect()
-        time.sleep(2)
 
     def generate_report(self):
         print("\n" + "="*70)
         print("FİNAL PERFORMANS KARŞILAŞTIRMA RAPORU")
         print("="*70)
         
-        e_lat = np.mean(self.results['edge']['latency'])
-        c_lat = np.mean(self.results['cloud']['latency'])
+        e_acc = self.results['edge']['latency']
+        c_acc = self.results['cloud']['latency']
+        e_lat = e_acc.mean()
+        c_lat = c_acc.mean()
         
         e_bw = self.results['edge']['bandwidth']
         c_bw = self.results['cloud']['bandwidth']
         
         print(f"\n1. HIZ (GECİKME)")
-        print(f"   Kenar Bilişim: {e_lat:.2f} ms")
-        print(f"   Bulut Bilişim: {c_lat:.2f} ms")
+        print(f"   Kenar Bilişim: {e_lat:.2f} ms (min {e_acc.min():.2f} / maks {e_acc.max():.2f})")
+        print(f"   Bulut Bilişim: {c_lat:.2f} ms (min {c_acc.min():.2f} / maks {c_acc.max():.2f})")
         print(f"   --> Hız Artışı: %{((c_lat-e_lat)/c_lat)*100:.1f}")
         
         print(f"\n2. BANT GENİŞLİĞİ (Veri Tasarrufu)")
@@ -125,6 +328,12 @@ class MQTTSystemSimulation:
         print(f"   Buluta Gönderilen (Edge):  {e_bw}")
         print(f"   Buluta Gönderilen (Cloud): {c_bw}")
         print(f"   --> Tasarruf: %{(1 - e_bw/c_bw)*100:.1f}")
+        e_bytes = self.results['edge']['bandwidth_bytes']
+        c_bytes = self.results['cloud']['bandwidth_bytes']
+        print(f"   Buluta Giden Bayt (Edge):  {e_bytes / 1024:.1f} KB")
+        print(f"   Buluta Giden Bayt (Cloud): {c_bytes / 1024:.1f} KB")
+        if c_bytes:
+            print(f"   --> Bayt Tasarrufu: %{(1 - e_bytes/c_bytes)*100:.1f}")
         
         print(f"\n3. YAPAY ZEKA ETKİSİ")
         print(f"   AI Tarafından Tespit Edilen Anomali: {self.results['edge'].get('ai_anomalies', 0)}")
@@ -137,29 +346,30 @@ class MQTTSystemSimulation:
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
         
         # Grafik 1: Gecikme
-        ax1.bar(['Edge (AI)', 'Cloud'], [el, cl], color=['#2ecc71', '#e74c3c'])
+        bars1 = ax1.bar(['Edge (AI)', 'Cloud'], [el, cl], color=['#2ecc71', '#e74c3c'])
         ax1.set_title('Ortalama Tepki Süresi (Düşük İyi)', fontsize=12)
         ax1.set_ylabel('Milisaniye (ms)')
-        for i, v in enumerate([el, cl]):
-            ax1.text(i, v, f"{v:.1f}ms", ha='center', va='bottom', fontweight='bold')
+        ax1.bar_label(bars1, fmt='%.1fms', fontweight='bold')
             
         # Grafik 2: Bant Genişliği
-        ax2.bar(['Edge (AI)', 'Cloud'], [eb, cb], color=['#3498db', '#95a5a6'])
+        bars2 = ax2.bar(['Edge (AI)', 'Cloud'], [eb, cb], color=['#3498db', '#95a5a6'])
         ax2.set_title('Buluta Gönderilen Veri Sayısı (Düşük İyi)', fontsize=12)
         ax2.set_ylabel('Mesaj Adedi')
-        for i, v in enumerate([eb, cb]):
-            ax2.text(i, v, str(v), ha='center', va='bottom', fontweight='bold')
+        ax2.bar_label(bars2, fmt='%d', fontweight='bold')
             
-        plt.suptitle(f' Yoğun Yük Testi ({self.num_cycles} Veri Paketi)', fontsize=16)
-        plt.savefig('output/final_simulation_report.png')
-        print(f"\n[INFO] Grafik kaydedildi: output/final_simulation_report.png")
+        fig.suptitle(f' Yoğun Yük Testi ({self.num_cycles} Veri Paketi)', fontsize=16)
+        
+        # Kaydetme arka planda; çizim bitti, ana akış beklemez
+        future = self._save_pool.submit(_save_figure, fig, 'output/final_simulation_report.png')
+        self._pending_saves.append(future)
+        return future
 
 if __name__ == "__main__":
     # 5000 veri paketi, 4 sensör ile simülasyonu başlat
     sim = MQTTSystemSimulation(num_cycles=5000, num_sensors=4)
     
-    sim.run_scenario(mode='edge')
-    
-    sim.run_scenario(mode='cloud')
+    # Edge ve Cloud aynı veri akışıyla tek geçişte ölçülür
+    sim.run_both()
     
     sim.generate_report()
+    sim.close()
@@ -0,0 +1,162 @@
+"""
+11_mqtt_network_loop.py
+Paylaşılan MQTT Ağ Döngüsü
+Birden fazla paho istemcisini tek iş parçacığında select() ile sürer
+"""
+
+import time
+import select
+import socket
+import threading
+
+class MQTTNetworkLoop:
+    """
+    loop_start() her istemci için ayrı bir ağ iş parçacığı açar.
+    Bu sınıf tüm istemcilerin soketlerini tek bir select() döngüsünde
+    bekler ve loop_read / loop_write / loop_misc çağrılarını sırayla yapar.
+
+    Sokete yalnızca döngü iş parçacığı yazar: on_socket_register_write
+    kayıtlıyken paho, publish() çağıran iş parçacığında loop_write yapmaz;
+    paket kuyruğa alınır ve döngü uyandırılır.
+
+    loop_forever gibi bağlantısı kopan istemcileri artan beklemeyle
+    (reconnect_delay'den reconnect_max_delay'e ikiye katlanarak) yeniden bağlar.
+    """
+
+    def __init__(self, timeout=0.1, reconnect_delay=1, reconnect_max_delay=30):
+        """
+        Args:
+            timeout (float): select() bekleme süresi (saniye)
+            reconnect_delay (float): İlk yeniden bağlanma beklemesi (saniye)
+            reconnect_max_delay (float): En uzun yeniden bağlanma beklemesi (saniye)
+        """
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.clients = []
+        # Kopmuş istemci -> (sonraki deneme zamanı, sonraki bekleme)
+        self._retry = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        # Başka iş parçacığı paket kuyruğa aldığında select()'i uyandıran soket çifti
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    def add(self, client):
+        """Bağlanmış (connect çağrılmış) istemciyi döngüye ekle"""
+        client.on_socket_register_write = self._wake
+        with self._lock:
+            self.clients.append(client)
+
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='mqtt-network-loop', daemon=True)
+            self._thread.start()
+
+    def remove(self, client):
+        """İstemciyi döngüden çıkar; döndükten sonra döngü istemciye dokunmaz"""
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+            self._retry.pop(client, None)
+        client.on_socket_register_write = None
+
+    def stop(self):
+        """Döngü iş parçacığını durdur ve uyandırma soketlerini kapat (döngü yeniden kullanılmaz)"""
+        self._running = False
+        if self._thread is not None:
+            self._wake(None, None, None)
+            self._thread.join()
+            self._thread = None
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _wake(self, client, userdata, sock):
+        """on_socket_register_write: yazılacak paket var, select()'ten çık"""
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass # Uyandırma zaten beklemede (ya da döngü durduruldu)
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                clients = list(self.clients)
+
+            sockets = {}
+            lost = []
+            for client in clients:
+                sock = client.socket()
+                if sock is not None:
+                    sockets[sock] = client
+                    if client.is_connected():
+                        self._retry.pop(client, None)
+                else:
+                    lost.append(client)
+            if lost:
+                self._reconnect(lost)
+
+            want_write = [sock for sock, client in sockets.items() if client.want_write()]
+            try:
+                readable, writable, _ = select.select(
+                    [self._wake_r, *sockets], want_write, [], self.timeout)
+            except (OSError, ValueError):
+                # Bu arada kapanan soket; bir sonraki turda liste yenilenir
+                continue
+
+            if self._wake_r in readable:
+                readable.remove(self._wake_r)
+                try:
+                    while self._wake_r.recv(4096): pass
+                except BlockingIOError:
+                    pass
+
+            # Kilit tutulurken remove() bekler: çıkarılan istemci yarıda işlenmez
+            with self._lock:
+                for sock in readable:
+                    if sockets[sock] in self.clients:
+                        sockets[sock].loop_read()
+                for sock in writable:
+                    if sockets[sock] in self.clients:
+                        sockets[sock].loop_write()
+                for client in clients:
+                    if client in self.clients:
+                        client.loop_misc()
+
+    def _reconnect(self, lost):
+        """Soketi kapanmış istemcileri yeniden bağla; başarısız denemede bekleme ikiye katlanır"""
+        now = time.monotonic()
+        # Kilit tutulur: remove() edilmiş istemci yeniden bağlanmaz
+        with self._lock:
+            for client in lost:
+                if client not in self.clients: continue
+                next_try, delay = self._retry.get(client, (now, self.reconnect_delay))
+                if now < next_try: continue
+                # CONNACK gelip is_connected() olana kadar kayıt kalır; hemen
+                # tekrar kopan istemci de artan beklemeyle denenir
+                self._retry[client] = (now + delay, min(delay * 2, self.reconnect_max_delay))
+                try:
+                    client.reconnect()
+                except OSError:
+                    pass # Broker henüz erişilemez; sonraki denemede tekrar
+
+
+def start_network(client, network_loop=None):
+    """İstemcinin ağ trafiğini başlat: paylaşılan döngü verilmişse ona ekle"""
+    if network_loop is not None:
+        network_loop.add(client)
+    else:
+        client.loop_start()
+
+
+def stop_network(client, network_loop=None):
+    """start_network'ün tersi; ardından bağlantıyı kapatır"""
+    if network_loop is not None:
+        # Önce döngüden çıkar: DISCONNECT bu iş parçacığında yazılır, döngüyle yarışmaz
+        network_loop.remove(client)
+        client.disconnect()
+    else:
+        client.loop_stop()
+        client.disconnect()
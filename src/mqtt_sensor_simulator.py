@@ -4,36 +4,114 @@ CANLI RASTGELE VERİ ÜRETİCİSİ
 Dosyadan okumaz, anlık olarak matematiksel modellerle veri üretir.
 """
 
-import json
 import time
-import random
 import numpy as np
-from datetime import datetime
+import msgpack
 import paho.mqtt.client as mqtt
+from mqtt_network_loop import start_network, stop_network
+
+try:
+    from numba import njit
+except ImportError:
+    # numba kurulu değilse aynı fonksiyon saf Python olarak çalışır
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+@njit(cache=True, fastmath=True)
+def _generate_step(health, base_temp, base_vib, degradation_rate,
+                   n_temp1, n_temp2, n_pressure, n_vib, n_rpm, is_sudden_spike):
+    """Bir döngülük sensör değerlerini ve yeni sağlık değerini hesaplar"""
+    # Sağlığı azalt (zamanla yıpranma)
+    if health > 0:
+        drop = degradation_rate
+        if is_sudden_spike: drop *= 10 # Ani hasar
+        health -= drop
+    
+    # Sağlık durumuna göre veriyi boz (Degradasyon faktörü)
+    deg_factor = (100 - health) / 100
+    if deg_factor < 0: deg_factor = 0.0
+    
+    # Veri Üretimi (Normal Dağılım + Degradasyon Etkisi)
+    # Sağlık kötüleştiğinde titreşim ve sıcaklık artar
+    temp1 = base_temp + (deg_factor * 50) + n_temp1
+    temp2 = 640 + (deg_factor * 60) + n_temp2
+    
+    # Spike varsa o anlık fırla
+    if is_sudden_spike:
+        temp1 += 30
+        temp2 += 40
+        
+    pressure = 14.5 + (deg_factor * 3) + n_pressure
+    
+    # Titreşim en kritik gösterge
+    vibration = base_vib + (deg_factor * 0.2) + n_vib
+    if is_sudden_spike: vibration += 0.1
+        
+    rpm = 2300 + (deg_factor * 250) + n_rpm
+    return temp1, temp2, pressure, vibration, rpm, health
 
 class MQTTSensorNode:
-    def __init__(self, node_id, broker='broker.hivemq.com', port=1883):
+    # Rastgele sayılar bu kadar döngülük bloklar halinde önceden üretilir
+    NOISE_BLOCK = 1024
+    # Ölçüm gürültüsü std sapmaları: temp1, temp2, pressure, vibration, rpm
+    NOISE_STD = np.array([2, 3, 0.3, 0.005, 20])
+    
+    def __init__(self, node_id, broker='broker.hivemq.com', port=1883, standalone=True, seed=None, verbose=True):
         self.node_id = node_id
         self.broker = broker
         self.port = port
         
-        self.client = mqtt.Client(client_id=f"sensor_gen_{node_id}")
+        # standalone=False: düğüm yalnızca durum tutar; istemci, bağlantı ve
+        # yayın SensorGroup'a aittir (group alanını grup atar)
+        self.client = None
+        self.group = None
+        if standalone:
+            self.client = mqtt.Client(client_id=f"sensor_gen_{node_id}")
+            self.client.on_connect = self.on_connect
         self.publish_topic = f"iot/sensors/{node_id}/data"
         self.connected = False
-        self.client.on_connect = self.on_connect
+        self.bytes_sent = 0
+        
+        # Her döngüde yeniden kurulmaz; alanları yerinde güncellenir.
+        # Packer da tekrar kullanılır (packb her çağrıda yenisini kurar).
+        self._measurements = {'temperature_1': 0.0, 'temperature_2': 0.0,
+                              'pressure': 0.0, 'vibration': 0.0, 'rpm': 0.0}
+        self._tail = {'ts_ms': 0, 'cycle': 0,
+                      'measurements': self._measurements, 'health': 0.0}
+        self._packer = msgpack.Packer(use_bin_type=True)
+        
+        # Sabit baş kısım (map başlığı + node_id) bir kez paketlenir; her
+        # döngüde yalnızca değişen alanlar paketlenip arkasına eklenir
+        self._prefix = (self._packer.pack_map_header(len(self._tail) + 1)
+                        + self._packer.pack('node_id') + self._packer.pack(node_id))
         
         # Simülasyon Durumu (Her sensörün kendi durumu var)
+        self._rng = np.random.default_rng(seed)
         self.cycle = 0
         self.health = 100.0
-        self.degradation_rate = random.uniform(0.01, 0.05) # Her sensör farklı hızda bozulur
+        self.degradation_rate = self._rng.uniform(0.01, 0.05) # Her sensör farklı hızda bozulur
         
         # Temel Değerler (Her sensör biraz farklı başlar)
-        self.base_temp = 520 + random.uniform(-5, 5)
-        self.base_vib = 0.02 + random.uniform(0, 0.01)
+        self.base_temp = 520 + self._rng.uniform(-5, 5)
+        self.base_vib = 0.02 + self._rng.uniform(0, 0.01)
+        self._refill_noise()
+        
+        # İlk çağrı derlemeyi tetikler; yayın döngüsüne yansımasın
+        _generate_step(100.0, 520.0, 0.02, 0.01, 0.0, 0.0, 0.0, 0.0, 0.0, False)
         
-        print(f"[Sensör {self.node_id}] Canlı simülasyon başlatıldı.")
+        if verbose:
+            print(f"[Sensör {self.node_id}] Canlı simülasyon başlatıldı.")
+
+    def reset_stats(self):
+        """Simülasyon durumunu ve sayaçları başa al (yeni senaryo için)"""
+        self.cycle = 0
+        self.health = 100.0
+        self.bytes_sent = 0
 
     def connect(self):
+        if self.group is not None:
+            # Grup üyesi: bağlantı paylaşılan istemcinindir; ilk çağrı grubu bağlar
+            return self.group.connect()
         try:
             self.client.connect(self.broker, self.port, 60)
             self.client.loop_start()
@@ -45,76 +123,239 @@ class MQTTSensorNode:
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0: self.connected = True
 
-    def generate_realtime_data(self):
-        """
-        Anlık, rastgele ama gerçekçi sensör verisi üretir.
-        """
+    def _refill_noise(self):
+        """Sonraki NOISE_BLOCK döngünün gürültü ve ani bozulma çekimleri (tek seferde)"""
+        noise = self._rng.standard_normal((self.NOISE_BLOCK, 5)) * self.NOISE_STD
+        self._noise = noise.tolist()
+        self._spikes = (self._rng.random(self.NOISE_BLOCK) < 0.02).tolist()
+        self._noise_idx = 0
+
+    def _step(self):
+        """Bir döngü ilerler; değişen alanları self._tail içine yazar"""
         self.cycle += 1
         
+        if self._noise_idx == self.NOISE_BLOCK:
+            self._refill_noise()
+        n_temp1, n_temp2, n_pressure, n_vib, n_rpm = self._noise[self._noise_idx]
+        
         # Rastgelelik: Bazen anlık ani bozulmalar olsun (%2 ihtimal)
-        is_sudden_spike = random.random() < 0.02
-        
-        # Sağlığı azalt (zamanla yıpranma)
-        if self.health > 0:
-            drop = self.degradation_rate
-            if is_sudden_spike: drop *= 10 # Ani hasar
-            self.health -= drop
-        
-        # Sağlık durumuna göre veriyi boz (Degradasyon faktörü)
-        deg_factor = (100 - self.health) / 100
-        if deg_factor < 0: deg_factor = 0
-        
-        # Veri Üretimi (Normal Dağılım + Degradasyon Etkisi)
-        # Sağlık kötüleştiğinde titreşim ve sıcaklık artar
-        temp1 = self.base_temp + (deg_factor * 50) + np.random.normal(0, 2)
-        temp2 = 640 + (deg_factor * 60) + np.random.normal(0, 3)
-        
-        # Spike varsa o anlık fırla
-        if is_sudden_spike:
-            temp1 += 30
-            temp2 += 40
-            
-        pressure = 14.5 + (deg_factor * 3) + np.random.normal(0, 0.3)
-        
-        # Titreşim en kritik gösterge
-        vibration = self.base_vib + (deg_factor * 0.2) + np.random.normal(0, 0.005)
-        if is_sudden_spike: vibration += 0.1
-            
-        rpm = 2300 + (deg_factor * 250) + np.random.normal(0, 20)
-
-        # Veri Paketi
-        reading = {
-            'node_id': self.node_id,
-            'timestamp': datetime.now().isoformat(),
-            'cycle': self.cycle,
-            'measurements': {
-                'temperature_1': round(temp1, 2),
-                'temperature_2': round(temp2, 2),
-                'pressure': round(pressure, 2),
-                'vibration': round(vibration, 4),
-                'rpm': round(rpm, 1)
-            },
-            'health': round(self.health, 2)
-        }
-        return reading
+        is_sudden_spike = self._spikes[self._noise_idx]
+        self._noise_idx += 1
+        
+        # Sayısal model derlenmiş fonksiyonda (numba varsa native kod)
+        temp1, temp2, pressure, vibration, rpm, self.health = _generate_step(
+            self.health, self.base_temp, self.base_vib, self.degradation_rate,
+            n_temp1, n_temp2, n_pressure, n_vib, n_rpm, is_sudden_spike)
+
+        # Veri Paketi (şablon yerinde güncellenir). Değerler yuvarlanmaz:
+        # MessagePack float boyutu sabit, biçimlendirme gösterimde yapılır
+        m = self._measurements
+        m['temperature_1'] = temp1
+        m['temperature_2'] = temp2
+        m['pressure'] = pressure
+        m['vibration'] = vibration
+        m['rpm'] = rpm
+        
+        tail = self._tail
+        tail['ts_ms'] = time.time_ns() // 1_000_000  # epoch ms (ISO metinden kısa)
+        tail['cycle'] = self.cycle
+        tail['health'] = self.health
+
+    def generate_packed(self):
+        """
+        Anlık, rastgele ama gerçekçi sensör okumasını doğrudan MessagePack
+        baytları olarak üretir (sabit baş kısım + değişen alanlar).
+        """
+        self._step()
+        # Paketlenen kuyruğun kendi map başlığı (ilk bayt) atlanır
+        return self._prefix + self._packer.pack(self._tail)[1:]
+
+    def generate_batch(self, n):
+        """
+        _step ile aynı modelden n döngüyü tek seferde (vektörel) üretir.
+        Döner: (ölçümler (n, 5): temp1, temp2, pressure, vibration, rpm;
+                sağlık (n,); döngü no (n,))
+        """
+        noise = self._rng.standard_normal((n, 5)) * self.NOISE_STD
+        spikes = self._rng.random(n) < 0.02
+        
+        # Sağlık sıfırın altına inene kadar her döngüde düşer, sonra sabit kalır
+        drops = np.where(spikes, self.degradation_rate * 10, self.degradation_rate)
+        health = self.health - np.cumsum(drops)
+        if self.health <= 0:
+            health[:] = self.health
+        else:
+            below = np.flatnonzero(health <= 0)
+            if below.size: health[below[0] + 1:] = health[below[0]]
+        deg_factor = np.maximum((100 - health) / 100, 0.0)
+        
+        values = noise
+        values[:, 0] += self.base_temp + deg_factor * 50 + spikes * 30
+        values[:, 1] += 640 + deg_factor * 60 + spikes * 40
+        values[:, 2] += 14.5 + deg_factor * 3
+        values[:, 3] += self.base_vib + deg_factor * 0.2 + spikes * 0.1
+        values[:, 4] += 2300 + deg_factor * 250
+        
+        cycles = np.arange(self.cycle + 1, self.cycle + n + 1)
+        if n:
+            self.cycle += n
+            self.health = float(health[-1])
+        return values, health, cycles
+
+    def packed_sizes(self, cycles):
+        """
+        generate_packed çıktısının bayt uzunlukları. Ölçümler ve zaman damgası
+        sabit boyda paketlenir; yalnızca 'cycle' tamsayısının boyu değişir.
+        """
+        template = dict(self._tail, ts_ms=time.time_ns() // 1_000_000, cycle=0)
+        base = len(self._prefix) + len(self._packer.pack(template)) - 2
+        # MessagePack uint: fixint 1, uint8 2, uint16 3, uint32 5, uint64 9 bayt
+        cycles = np.asarray(cycles)
+        return base + np.select([cycles < 128, cycles < 256, cycles < 65536, cycles < 2**32],
+                                [1, 2, 3, 5], 9)
 
     def read_and_publish(self):
         if not self.connected: return False
         
-        # Canlı veri üret
-        data = self.generate_realtime_data()
-        
-        # Gönder
-        self.client.publish(self.publish_topic, json.dumps(data))
+        # Canlı veri üret ve paketle (MessagePack: JSON metnine göre ~%50 daha az bayt)
+        payload = self.generate_packed()
+        # Grup üyesi kendi konusuna grubun paylaşılan istemcisiyle yayın yapar
+        client = self.client if self.group is None else self.group.client
+        client.publish(self.publish_topic, payload)
+        self.bytes_sent += len(payload)
         return True
 
     def disconnect(self):
+        if self.group is not None:
+            self.group.disconnect() # İlk çağrı grubu kapatır, sonrakiler etkisiz
+            return
         self.client.loop_stop()
         self.client.disconnect()
 
+class SensorGroup:
+    """
+    Sensörler tek bir MQTT istemcisini paylaşır: tek soket, tek ağ
+    iş parçacığı (loop_start bir kez). Liste gibi gezilebilir.
+    """
+    
+    # Bir döngüdeki tüm okumalar tek mesajda bu konuya gider
+    BATCH_TOPIC = "iot/sensors/batch/data"
+    
+    def __init__(self, nodes, client, broker='broker.hivemq.com', port=1883):
+        self.nodes = nodes
+        self.client = client
+        self.broker = broker
+        self.port = port
+        self.connected = False
+        self._network_loop = None
+        self._started = False
+        self.batch_bytes_sent = 0
+        self._packer = msgpack.Packer(use_bin_type=True)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        for node in self.nodes: node.group = self
+        
+        # Sensör sayısı senaryo boyunca sabit: bağlı metotlar ve tam
+        # dizi başlığı bir kez hazırlanır, her döngüde yeniden aranmaz
+        self._generators = [node.generate_packed for node in nodes]
+        self._full_header = self._packer.pack_array_header(len(nodes))
+    
+    def __iter__(self):
+        return iter(self.nodes)
+    
+    def __len__(self):
+        return len(self.nodes)
+    
+    def __getitem__(self, index):
+        return self.nodes[index]
+    
+    @property
+    def bytes_sent(self):
+        """Tüm sensörlerin yayınladığı toplam yük (bayt)"""
+        return self.batch_bytes_sent + sum(node.bytes_sent for node in self.nodes)
+    
+    def reset_stats(self):
+        """Tüm sensörleri ve toplu yayın sayacını sıfırla; bağlantı korunur"""
+        self.batch_bytes_sent = 0
+        for node in self.nodes: node.reset_stats()
+    
+    def generate_batch(self, n):
+        """
+        n okumayı sensörler arasında sırayla (i % len) tek seferde üretir.
+        Döner: (node_id (n,), ölçümler (n, 5), sağlık (n,), paket boyu (n,))
+        """
+        k = len(self.nodes)
+        node_ids = np.empty(n, dtype=np.int64)
+        values = np.empty((n, 5))
+        health = np.empty(n)
+        sizes = np.empty(n, dtype=np.int64)
+        for j, node in enumerate(self.nodes):
+            rows = slice(j, n, k)
+            v, h, cycles = node.generate_batch(len(range(j, n, k)))
+            node_ids[rows] = node.node_id
+            values[rows] = v
+            health[rows] = h
+            sizes[rows] = node.packed_sizes(cycles)
+        return node_ids, values, health, sizes
+    
+    def connect(self, timeout=5, network_loop=None):
+        # Düğümler üzerinden tekrar çağrılabilir; istemci yalnızca bir kez bağlanır
+        if not self._started:
+            try:
+                self.client.connect(self.broker, self.port, 60)
+                self._network_loop = network_loop
+                start_network(self.client, network_loop)
+                self._started = True
+            except:
+                return False
+        
+        start = time.time()
+        while not self.client.is_connected() and (time.time() - start) < timeout:
+            time.sleep(0.05)
+        return self.client.is_connected()
+    
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connected = True
+            for node in self.nodes: node.connected = True
+    
+    def on_disconnect(self, client, userdata, rc):
+        # Bağlantı koptu: publish_all yeniden bağlanana kadar 0 döner
+        self.connected = False
+        for node in self.nodes: node.connected = False
+    
+    def publish_all(self, limit=None):
+        """
+        Her sensörden bir okuma üretip hepsini tek MQTT mesajında
+        (MessagePack dizisi) yayınlar. Gönderilen okuma sayısını döner.
+        """
+        if not self.connected: return 0
+        
+        # Okumalar zaten paketli; dizi başlığının arkasına eklenir
+        generators = self._generators
+        if limit is None or limit >= len(generators):
+            header = self._full_header
+        else:
+            generators = generators[:limit]
+            header = self._packer.pack_array_header(len(generators))
+        payload = header + b''.join([gen() for gen in generators])
+        self.client.publish(self.BATCH_TOPIC, payload)
+        self.batch_bytes_sent += len(payload)
+        return len(generators)
+    
+    def disconnect(self):
+        if not self._started: return
+        self._started = False
+        self.connected = False
+        for node in self.nodes: node.connected = False
+        stop_network(self.client, self._network_loop)
+
 # Yardımcı Fonksiyon
-def create_mqtt_sensors(num_sensors=4, broker='broker.hivemq.com', port=1883):
+def create_mqtt_sensors(num_sensors=4, broker='broker.hivemq.com', port=1883, verbose=False):
+    client = mqtt.Client(client_id="sensor_gen_group")
     nodes = []
     for i in range(1, num_sensors + 1):
-        nodes.append(MQTTSensorNode(node_id=i, broker=broker, port=port))
-    return nodes
\ No newline at end of file
+        nodes.append(MQTTSensorNode(node_id=i, broker=broker, port=port, standalone=False, verbose=verbose))
+    if not verbose:
+        print(f"[Sensör Grubu] {num_sensors} canlı sensör başlatıldı.")
+    return SensorGroup(nodes, client, broker, port)
\ No newline at end of file
@@ -6,13 +6,14 @@ Isolation Forest yerine Supervised Learning kullanılır.
 
 import pandas as pd
 import numpy as np
-import pickle
+import joblib
 import os
+import matplotlib
+matplotlib.use('Agg')  # Ekran yok; PNG üretimi için GUI'siz backend
 import matplotlib.pyplot as plt
-import seaborn as sns
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+from sklearn.metrics import classification_report, accuracy_score
 
 def train_high_performance_model():
     print("\n" + "="*70)
@@ -22,9 +23,13 @@ def train_high_performance_model():
     os.makedirs('models', exist_ok=True)
     os.makedirs('output', exist_ok=True)
     
-    # 1. Veri Yükleme
+    # Özellikler (model yalnızca bu sensörleri ve etiket için sağlığı kullanır)
+    features = ['sensor_temp1', 'sensor_temp2', 'sensor_pressure', 'sensor_vibration', 'sensor_rpm']
+    
+    # 1. Veri Yükleme (yalnızca gerekli sütunlar, float32)
     try:
-        df = pd.read_csv('data/turbofan_sensor_data.csv')
+        df = pd.read_csv('data/turbofan_sensor_data.csv',
+                         usecols=features + ['health_indicator'], dtype=np.float32, engine='c')
         print(f"✓ Veri seti yüklendi: {len(df)} kayıt")
     except FileNotFoundError:
         print("✗ Veri dosyası bulunamadı!")
@@ -39,23 +44,38 @@ def train_high_performance_model():
     print(f"\nSınıf Dağılımı:")
     print(df['label'].value_counts().rename({0: 'Normal', 1: 'Arıza'}))
 
-    # 3. Özellik Seçimi
-    features = ['sensor_temp1', 'sensor_temp2', 'sensor_pressure', 'sensor_vibration', 'sensor_rpm']
-    X = df[features]
-    y = df['label']
+    # 3. Özellik Seçimi (sklearn'e bir kez NumPy'a çevrilmiş diziler verilir;
+    # fit/predict her çağrıda DataFrame'i yeniden dönüştürüp doğrulamaz)
+    X = df[features].to_numpy(dtype=np.float32, copy=False)
+    y = df['label'].to_numpy()
     
     # 4. Eğitim/Test Bölmesi (%20 Test)
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
     
+    # 4b. Dengesiz veride çoğunluk sınıfı eğitim kümesinde seyreltilir (en fazla
+    # azınlığın MAJORITY_RATIO katı). Ağaçlar gereksiz "normal" örneklerle
+    # uğraşmaz; test kümesine dokunulmaz, doğruluk orijinal dağılımda ölçülür.
+    MAJORITY_RATIO = 3
+    counts = np.bincount(y_train, minlength=2)
+    majority = counts.argmax()
+    limit = MAJORITY_RATIO * counts.min()
+    if counts[majority] > limit:
+        rng = np.random.default_rng(42)
+        kept = rng.choice(np.flatnonzero(y_train == majority), size=limit, replace=False)
+        keep = np.sort(np.concatenate([np.flatnonzero(y_train != majority), kept]))
+        X_train, y_train = X_train[keep], y_train[keep]
+        print(f"✓ Eğitim kümesi dengelendi: {len(y_train)} kayıt")
+    
     # 5. Model Eğitimi (Random Forest)
     print("\nModel eğitiliyor (Random Forest)...")
-    # class_weight='balanced': Arıza verisi az olsa bile ona öncelik ver
-    model = RandomForestClassifier(n_estimators=100, class_weight='balanced', random_state=42)
+    # class_weight='balanced': Seyreltmeden sonra kalan dengesizliği (<= 3:1) telafi eder
+    # n_jobs=-1: ağaçlar birbirinden bağımsız, tüm çekirdeklerde paralel eğitilir
+    model = RandomForestClassifier(n_estimators=100, class_weight='balanced', random_state=42, n_jobs=-1)
     model.fit(X_train, y_train)
     
-    # 6. Kaydetme (Scaler'a gerek yok, RF ölçekten bağımsız çalışır ama kod uyumu için boş geçebiliriz)
-    with open('models/anomaly_detector.pkl', 'wb') as f:
-        pickle.dump(model, f)
+    # 6. Kaydetme (Scaler yok: ağaç tabanlı model ölçekten bağımsız, ham sensör değerleriyle çalışır)
+    # joblib ağaç dizilerini tek blok halinde yazar; compress=3 (zlib) dosyayı küçültür
+    joblib.dump(model, 'models/anomaly_detector.pkl', compress=3)
     
     print("✓ Model 'models/anomaly_detector.pkl' olarak kaydedildi.")
     
@@ -71,13 +91,22 @@ def train_high_performance_model():
     print("\nDetaylı Rapor:")
     print(classification_report(y_test, y_pred, target_names=['Normal', 'Arıza']))
     
-    # 8. Confusion Matrix
-    cm = confusion_matrix(y_test, y_pred)
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Greens',
-                xticklabels=['Tahmin: Normal', 'Tahmin: Arıza'],
-                yticklabels=['Gerçek: Normal', 'Gerçek: Arıza'])
+    # 8. Confusion Matrix (ikili etiketlerde tek bincount geçişi)
+    # gerçek*2 + tahmin -> 0:TN, 1:FP, 2:FN, 3:TP
+    actual = (y_test == 1).astype(np.uint8)
+    pred = (y_pred == 1).astype(np.uint8)
+    cm = np.bincount(actual * 2 + pred, minlength=4).reshape(2, 2)
+    fig, ax = plt.subplots(figsize=(8, 6))
+    im = ax.imshow(cm, cmap='Greens')
+    fig.colorbar(im, ax=ax)
+    ax.set_xticks([0, 1], ['Tahmin: Normal', 'Tahmin: Arıza'])
+    ax.set_yticks([0, 1], ['Gerçek: Normal', 'Gerçek: Arıza'])
+    # Hücre değerleri (koyu hücrede beyaz yazı)
+    for (i, j), v in np.ndenumerate(cm):
+        ax.text(j, i, str(v), ha='center', va='center',
+                color='white' if v > cm.max() / 2 else 'black')
     plt.title(f'Random Forest Başarı Matrisi\nDoğruluk: %{acc*100:.1f}')
+    plt.tight_layout()
     plt.savefig('output/ai_model_accuracy_matrix.png')
     
     # 9. Özellik Önem Düzeyleri (Feature Importance)
@@ -87,9 +116,14 @@ def train_high_performance_model():
         'Önem': model.feature_importances_
     }).sort_values('Önem', ascending=False)
     
-    plt.figure(figsize=(10, 5))
-    sns.barplot(x='Önem', y='Sensör', data=feature_importance, palette='viridis')
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.barh(feature_importance['Sensör'], feature_importance['Önem'],
+            color=plt.cm.viridis(np.linspace(0, 1, len(feature_importance))))
+    ax.invert_yaxis()  # En önemli sensör en üstte
+    ax.set_xlabel('Önem')
+    ax.set_ylabel('Sensör')
     plt.title('Hangi Sensör Arızayı Belirliyor? (Feature Importance)')
+    plt.tight_layout()
     plt.savefig('output/ai_feature_importance.png')
     
     print("\nÖzellik Önem Sıralaması:")